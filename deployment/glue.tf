@@ -155,7 +155,9 @@ resource "aws_glue_job" "csv_to_parquet" {
     "--job-bookmark-option"              = "job-bookmark-disable"
     "--enable-metrics"                   = "true"
     "--enable-continuous-cloudwatch-log" = "true"
-    "--additional-python-modules"        = "awswrangler"
+    # Python shell jobs get pandas/pyarrow from the analytics library set,
+    # not from the Spark runtime selected by glue_version
+    "library-set"                        = "analytics"
     "--extra-py-files"                   = "s3://${aws_s3_bucket.glue_scripts.bucket}/${aws_s3_object.csv_to_parquet_module.key}"
     "--TempDir"                         = "s3://${aws_s3_bucket.glue_scripts.bucket}/temp/"
   }
@@ -1,6 +1,6 @@
-# AWS-provided awswrangler layer ARN
+# AWS-provided SDK for pandas layer ARN (supplies pandas/pyarrow/boto3)
 locals {
-  awswrangler_layer_arn = "arn:aws:lambda:us-east-1:336392948345:layer:AWSSDKPandas-Python312:19"
+  sdk_pandas_layer_arn = "arn:aws:lambda:us-east-1:336392948345:layer:AWSSDKPandas-Python312:19"
 }
 
 # Create deployment package for Lambda function
@@ -82,7 +82,7 @@ resource "aws_lambda_function" "csv_to_parquet" {
   source_code_hash = data.archive_file.lambda_zip.output_base64sha256
 
   layers = [
-    local.awswrangler_layer_arn
+    local.sdk_pandas_layer_arn
   ]
 
   environment {
@@ -1,76 +1,212 @@
 """Convert CSV files from S3 to Parquet format with appropriate typing and column naming."""
 
+import os
 import re
-import awswrangler as wr
+import boto3
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from boto3.s3.transfer import TransferConfig
+from pyarrow import fs as pafs
+
+# Compiled once at import so column cleaning doesn't recompile per call
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Arrow types for the medical imaging dataset, keyed by cleaned column name
+_COLUMN_TYPES = {
+    'image_index': pa.string(),
+    'finding_labels': pa.string(),
+    'follow_up': pa.int64(),
+    'patient_id': pa.int64(),
+    'patient_age': pa.int64(),
+    'patient_gender': pa.dictionary(pa.int32(), pa.string()),
+    'view_position': pa.dictionary(pa.int32(), pa.string()),
+    'originalimagewidth': pa.int64(),
+    'originalimageheight': pa.int64(),
+    'originalimagepixelspacingx': pa.float64(),
+    'originalimagepixelspacingy': pa.float64()
+}
+
+# CSV block size for the streaming reader; peak memory is bounded by a few
+# blocks rather than the full file
+_CSV_BLOCK_SIZE = 8 << 20
+
+# Roll to a new Parquet part file after this many rows so Athena/Spark can
+# parallelize reads across files instead of scanning one monolithic file
+_MAX_ROWS_PER_FILE = 1_000_000
+
+# CSVs up to this size are downloaded to ephemeral storage with the parallel
+# transfer manager and parsed from a memory map. Lambda guarantees 512MB of
+# /tmp; cap well below that so the download always fits alongside whatever
+# else the container has staged there
+_LOCAL_FAST_PATH_MAX_BYTES = 256 * 1024 * 1024
 
 
 def clean_column_name(column_name: str) -> str:
     """Convert column name to snake_case without special characters."""
-    # Remove special characters except spaces and alphanumeric
-    cleaned = re.sub(r'[^\w\s]', '', column_name)
-    # Replace spaces with underscores and convert to lowercase
-    snake_case = re.sub(r'\s+', '_', cleaned.strip()).lower()
-    return snake_case
+    # Remove special characters, then replace spaces with underscores
+    cleaned = _SPECIAL_CHARS_RE.sub('', column_name)
+    return _WHITESPACE_RE.sub('_', cleaned.strip()).lower()
+
+
+def _clean_column_names(names) -> list:
+    """Clean an iterable of column names with vectorized string ops."""
+    return list(
+        pd.Index(names)
+        .str.replace(_SPECIAL_CHARS_RE, '', regex=True)
+        .str.strip()
+        .str.replace(_WHITESPACE_RE, '_', regex=True)
+        .str.lower()
+    )
+
+
+def _target_schema(raw_schema: pa.Schema) -> pa.Schema:
+    """Build the output schema: cleaned names, mapped types where known."""
+    fields = []
+    for name, field in zip(_clean_column_names(raw_schema.names), raw_schema):
+        fields.append(pa.field(name, _COLUMN_TYPES.get(name, field.type)))
+    return pa.schema(fields)
+
+
+def _open_csv_reader(s3: pafs.S3FileSystem, bucket: str,
+                     csv_key: str) -> pacsv.CSVStreamingReader:
+    """
+    Open a streaming CSV reader for an S3 object.
+
+    Small objects are downloaded to /tmp with the parallel transfer manager
+    and memory-mapped, avoiding botocore's buffered streaming; larger ones
+    are read directly from S3.
+    """
+    read_options = pacsv.ReadOptions(block_size=_CSV_BLOCK_SIZE)
+    s3_client = boto3.client('s3')
+
+    size = s3_client.head_object(Bucket=bucket, Key=csv_key)['ContentLength']
+    if size <= _LOCAL_FAST_PATH_MAX_BYTES:
+        local_path = f"/tmp/{os.path.basename(csv_key)}"
+        s3_client.download_file(
+            bucket, csv_key, local_path,
+            Config=TransferConfig(multipart_chunksize=8 << 20,
+                                  max_concurrency=10)
+        )
+        source = pa.memory_map(local_path)
+        # Unlink immediately: the mapping stays valid until closed, and the
+        # file must not accumulate in /tmp across warm invocations
+        os.remove(local_path)
+        return pacsv.open_csv(source, read_options=read_options)
+
+    return pacsv.open_csv(s3.open_input_stream(f"{bucket}/{csv_key}"),
+                          read_options=read_options)
+
+
+def _open_part_writer(s3: pafs.S3FileSystem, bucket: str, parquet_key: str,
+                      part: int, schema: pa.Schema):
+    """Open the output stream and Parquet writer for one part file."""
+    sink = s3.open_output_stream(
+        f"{bucket}/{parquet_key}/part-{part:05d}.parquet"
+    )
+    writer = pq.ParquetWriter(
+        sink, schema,
+        compression='zstd',
+        compression_level=3
+    )
+    return sink, writer
+
+
+def _delete_part_files(s3: pafs.S3FileSystem, bucket: str, parquet_key: str,
+                       count: int) -> None:
+    """Best-effort cleanup of part files after a failed conversion."""
+    for i in range(count):
+        path = f"{bucket}/{parquet_key}/part-{i:05d}.parquet"
+        try:
+            s3.delete_file(path)
+        except Exception as e:
+            print(f"Warning: could not delete {path}: {e}")
 
 
 def convert_csv_to_parquet(bucket: str, csv_key: str) -> str:
     """
-    Read CSV from S3, apply appropriate types, clean column names, and save as Parquet.
-    
+    Stream CSV from S3, apply appropriate types, clean column names, and save as Parquet.
+
+    Reads the CSV in fixed-size blocks and writes Parquet row groups as they
+    arrive, so the full table is never held in memory. Output is split into
+    part files of at most _MAX_ROWS_PER_FILE rows under the returned prefix.
+
     Args:
         bucket: S3 bucket name
         csv_key: S3 key for the CSV file
-        
+
     Returns:
-        S3 key for the created Parquet file
+        S3 key prefix for the created Parquet part files
     """
-    # Read CSV from S3
-    s3_csv_path = f"s3://{bucket}/{csv_key}"
-    df = wr.s3.read_csv(s3_csv_path)
-    
-    # Clean column names
-    df.columns = [clean_column_name(col) for col in df.columns]
-    
-    # Apply appropriate data types based on the medical imaging dataset structure
-    type_mapping = {
-        'image_index': 'string',
-        'finding_labels': 'string', 
-        'follow_up': 'int64',
-        'patient_id': 'int64',
-        'patient_age': 'int64',
-        'patient_gender': 'category',
-        'view_position': 'category',
-        'originalimagewidth': 'int64',
-        'originalimageheight': 'int64',
-        'originalimagepixelspacingx': 'float64',
-        'originalimagepixelspacingy': 'float64'
-    }
-    
-    # Apply types only for columns that exist in the dataframe
-    for col, dtype in type_mapping.items():
-        if col in df.columns:
-            if dtype == 'category':
-                df[col] = df[col].astype('category')
-            elif dtype == 'int64':
-                df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
-            elif dtype == 'float64':
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            elif dtype == 'string':
-                df[col] = df[col].astype('string')
-    
-    # Create parquet key by replacing .csv with .parquet
+    s3 = pafs.S3FileSystem()
+
+    # Create parquet prefix by replacing .csv with .parquet
     parquet_key = csv_key.replace('.csv', '.parquet')
-    s3_parquet_path = f"s3://{bucket}/{parquet_key}"
-    
-    # Write to S3 as Parquet
-    wr.s3.to_parquet(
-        df=df,
-        path=s3_parquet_path,
-        index=False,
-        compression='snappy'
+
+    reader = _open_csv_reader(s3, bucket, csv_key)
+    schema = _target_schema(reader.schema)
+
+    # Decide once whether any column actually needs coercion; when the
+    # inferred types already match the target schema, each batch only
+    # needs its column names swapped
+    cast_needed = any(
+        field.type != raw_field.type
+        for field, raw_field in zip(schema, reader.schema)
     )
-    
+
+    # Open the first part file eagerly so a header-only CSV still produces
+    # a schema-only Parquet file at the returned key
+    sink, writer = _open_part_writer(s3, bucket, parquet_key, 0, schema)
+    part = 1
+    rows_in_file = 0
+    try:
+        for batch in reader:
+            # Rename to cleaned column names and coerce to the
+            # target types batch by batch
+            if cast_needed:
+                table = (
+                    pa.Table.from_batches([batch])
+                    .rename_columns(schema.names)
+                    .cast(schema)
+                )
+            else:
+                table = pa.Table.from_arrays(batch.columns, schema=schema)
+
+            # Write in slices so no part file ever exceeds the row cap,
+            # rolling to a new part whenever the current one fills up
+            offset = 0
+            while offset < table.num_rows:
+                if rows_in_file >= _MAX_ROWS_PER_FILE:
+                    writer.close()
+                    sink.close()
+                    sink, writer = _open_part_writer(s3, bucket, parquet_key,
+                                                     part, schema)
+                    part += 1
+                    rows_in_file = 0
+
+                take = min(_MAX_ROWS_PER_FILE - rows_in_file,
+                           table.num_rows - offset)
+                writer.write_table(table.slice(offset, take))
+                rows_in_file += take
+                offset += take
+    except Exception:
+        # A mid-stream failure must not leave valid-looking output at the
+        # prefix downstream readers scan: finalize the in-flight part so it
+        # is deletable, then remove every part written so far
+        try:
+            writer.close()
+            sink.close()
+        finally:
+            _delete_part_files(s3, bucket, parquet_key, part)
+        raise
+    else:
+        writer.close()
+        sink.close()
+    finally:
+        reader.close()
+
     return parquet_key
 
 
@@ -78,7 +214,7 @@ def main():
     """Example usage of the CSV to Parquet conversion."""
     bucket_name = "adc-mjl-landing-zone"
     csv_file = "Data_Entry_2017.csv"
-    
+
     try:
         parquet_key = convert_csv_to_parquet(bucket_name, csv_file)
         print(f"Successfully converted {csv_file} to {parquet_key}")
@@ -87,4 +223,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,9 +1,22 @@
 """AWS Lambda wrapper for CSV to Parquet conversion triggered by S3 events."""
 
+import functools
 import json
 import urllib.parse
 from typing import Dict, Any
-from aws_py_data_eng.csv_to_parquet import convert_csv_to_parquet
+
+
+@functools.lru_cache(maxsize=1)
+def _get_converter():
+    """
+    Import the conversion function on first use.
+
+    csv_to_parquet pulls in pandas and pyarrow, which add hundreds of ms to
+    Lambda cold start; deferring the import keeps init fast, and the cache
+    makes warm invocations pay the import only once.
+    """
+    from aws_py_data_eng.csv_to_parquet import convert_csv_to_parquet
+    return convert_csv_to_parquet
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -30,13 +43,15 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             if not bucket or not object_key:
                 raise ValueError("Missing bucket name or object key in S3 event record")
             
-            # URL decode the object key (S3 keys are URL encoded in events)
-            object_key = urllib.parse.unquote_plus(object_key)
+            # URL decode the object key (S3 keys are URL encoded in events);
+            # skip the decode when the key contains no encoded characters
+            if '%' in object_key or '+' in object_key:
+                object_key = urllib.parse.unquote_plus(object_key)
             
             print(f"Processing CSV file: {object_key} from bucket: {bucket}")
             
             # Convert CSV to Parquet
-            parquet_key = convert_csv_to_parquet(bucket, object_key)
+            parquet_key = _get_converter()(bucket, object_key)
             
             results.append({
                 'source_file': object_key,